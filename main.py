@@ -1,24 +1,86 @@
+import asyncio
+import hashlib
 import logging
-import io
-from fastapi import FastAPI, File, Form, UploadFile, HTTPException
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, File, Form, Request, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
 
 # Import local modules (models.py, parser_logic.py)
 from models import StatementDetails, ErrorDetail
-from parser_logic import parse_statement, PasswordError, ParsingError
+from parser_logic import parse_statement, PasswordError, ParsingError, LOG_FORMAT
 
 # --- Logging Configuration ---
 # Configure logging to output a standard format.
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
+    format=LOG_FORMAT,
     handlers=[
         logging.StreamHandler()
     ]
 )
 log = logging.getLogger(__name__)
 
+# --- Parser Thread Pool ---
+# parse_statement is blocking; run it here so the event loop stays free to
+# serve other requests (and /health) while a PDF is being parsed.
+# One thread only: table extraction (Page.find_tables) is Python code that
+# holds the GIL, and PyMuPDF doesn't support use from multiple threads.
+# Scale parsing throughput with more server worker processes instead
+# (e.g. gunicorn -w N).
+PARSER_POOL = ThreadPoolExecutor(max_workers=1)
+
+# --- Upload Validation ---
+# Uploads are identified by their magic bytes, which PDF readers accept
+# anywhere in the first PDF_MAGIC_WINDOW bytes. Requests whose Content-Length
+# exceeds MAX_PDF_BYTES (default 50 MB) plus room for the rest of the
+# multipart form are rejected by middleware before the body is received.
+PDF_MAGIC = b"%PDF-"
+PDF_MAGIC_WINDOW = 1024
+MAX_PDF_BYTES = int(os.getenv("ZUNO_MAX_PDF_BYTES", 50 * 1024 * 1024))
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# --- Parse Result Cache ---
+# Users often re-submit the same statement (e.g. after editing form fields),
+# so results are kept in a small LRU keyed by a hash of (file, password).
+# Only the digest is kept, never the password itself.
+PARSE_CACHE_SIZE = 128
+_parse_cache: "OrderedDict[bytes, StatementDetails]" = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+
+def _cache_key(file_bytes: bytes, password: str) -> bytes:
+    """Hashes the password (length-prefixed) and the file bytes into one digest."""
+    password_bytes = password.encode()
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(len(password_bytes).to_bytes(8, "big"))
+    hasher.update(password_bytes)
+    hasher.update(file_bytes)
+    return hasher.digest()
+
+
+def _parse_cached(file_bytes: bytes, password: str) -> StatementDetails:
+    """Returns the cached result for this file/password, parsing it on a miss."""
+    key = _cache_key(file_bytes, password)
+    with _parse_cache_lock:
+        if key in _parse_cache:
+            _parse_cache.move_to_end(key)
+            log.info("Returning cached result for a previously parsed statement.")
+            return _parse_cache[key]
+
+    details = parse_statement(file_bytes, password)
+
+    with _parse_cache_lock:
+        _parse_cache[key] = details
+        _parse_cache.move_to_end(key)
+        if len(_parse_cache) > PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    return details
+
+
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="Zuno PDF Parser Service",
@@ -27,6 +89,26 @@ app = FastAPI(
 )
 
 
+# --- Middleware ---
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """
+    Rejects parse requests by their Content-Length header, before FastAPI
+    parses the multipart body and spools the upload to disk. Requests without
+    the header (chunked uploads) fall through to the size checks in the endpoint.
+    """
+    if request.url.path == "/parse-statement/":
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > MAX_PDF_BYTES + MULTIPART_OVERHEAD_BYTES:
+            log.warning(f"Rejected upload by Content-Length: {content_length} bytes")
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File too large. Maximum size is {MAX_PDF_BYTES} bytes."},
+            )
+    return await call_next(request)
+
+
 # --- Exception Handlers (Production Grade) ---
 
 @app.exception_handler(HTTPException)
@@ -67,6 +149,7 @@ async def health_check():
     tags=["Parsing"],
     responses={
         400: {"model": ErrorDetail, "description": "Invalid password or file type"},
+        413: {"model": ErrorDetail, "description": "File too large"},
         422: {"model": ErrorDetail, "description": "Failed to parse the PDF structure"},
         500: {"model": ErrorDetail, "description": "Internal server error"},
     }
@@ -83,20 +166,33 @@ async def parse_pdf_statement(
     """
     log.info(f"Received parsing request for file: {file.filename}")
 
-    # 1. Basic File Validation
-    if not file.filename or not file.filename.lower().endswith('.pdf'):
+    # 1. Basic File Validation (before the full read)
+    # Oversized requests with a Content-Length were already rejected by the
+    # middleware; these checks cover uploads whose size wasn't declared.
+    if file.size is not None and file.size > MAX_PDF_BYTES:
+        log.warning(f"File too large: {file.filename} ({file.size} bytes)")
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {MAX_PDF_BYTES} bytes.")
+
+    # Sniff the magic bytes rather than trusting the file extension
+    header = await file.read(PDF_MAGIC_WINDOW)
+    await file.seek(0)
+    if PDF_MAGIC not in header:
         log.warning(f"Invalid file type: {file.filename}")
         raise HTTPException(status_code=400, detail="Invalid file type. Only PDF files are accepted.")
 
-    try:
-        # 2. Read file bytes from the upload
-        file_bytes = await file.read()
+    # 2. Read file bytes from the upload
+    # Read at most one byte past the limit in case the size wasn't known up front
+    file_bytes = await file.read(MAX_PDF_BYTES + 1)
+    if len(file_bytes) > MAX_PDF_BYTES:
+        log.warning(f"File too large: {file.filename}")
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {MAX_PDF_BYTES} bytes.")
 
+    try:
         # 3. Call the core parsing logic
         log.info(f"Attempting to parse PDF with {len(file_bytes)} bytes...")
-        details = parse_statement(
-            file_bytes=io.BytesIO(file_bytes),
-            password=password
+        # PyMuPDF reads straight from the bytes, no BytesIO copy needed
+        details = await asyncio.get_running_loop().run_in_executor(
+            PARSER_POOL, _parse_cached, file_bytes, password
         )
 
         log.info(f"Successfully parsed statement for: {details.name_on_card}")
@@ -1,9 +1,12 @@
-import pdfplumber
+import pymupdf
 import re
-import io
+import os
+import math
 import logging
-from typing import List, Optional
-from decimal import Decimal, InvalidOperation
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
 
 # Import the Pydantic models
 from models import StatementDetails, Transaction
@@ -11,6 +14,9 @@ from models import StatementDetails, Transaction
 # Get the logger instance
 log = logging.getLogger(__name__)
 
+# Shared with main.py, and used to configure logging in page-pool workers
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
 
 # --- Custom Exceptions ---
 
@@ -27,43 +33,64 @@ class ParsingError(Exception):
 # --- Regex Patterns (Updated for Robustness) ---
 # These are compiled once for efficiency.
 
-# Rule 1: Find the card name. We'll capture the full line and clean it later.
-# This finds a line ending in "Credit Card Statement"
-CARD_NAME_RE = re.compile(r"^\s*(.* Credit Card) Statement", re.MULTILINE)
+# The page text comes from plain (non-layout) extraction, so these patterns
+# don't rely on line starts or column alignment.
+
+# Rule 1: Find the card name. We'll capture the text and clean it later.
+# This finds the text on the same line before "Credit Card Statement"
+CARD_NAME_RE = re.compile(r"(.*? Credit Card) Statement")
 
 # Rule 3: Find the Name on Card.
-# This looks for a line starting with 10+ ALL CAPS characters (the name)
-# followed by spaces, then "Credit Card No."
-NAME_ON_CARD_RE = re.compile(r"^\s*([A-Z\s]{10,})\s+Credit Card No\.", re.MULTILINE)
+# This looks for 10+ ALL CAPS characters/spaces on one line (the name)
+# followed by whitespace (possibly a line break), then "Credit Card No."
+NAME_ON_CARD_RE = re.compile(r"\b([A-Z][A-Z ]{9,}?)\s+Credit Card No\.")
 
 # Rule 2: Find the Last 4 Digits.
-# This finds "Credit Card No.", matches any characters (non-greedy),
-# then "XXXXXX", and then captures the 4 digits.
-CARD_NUMBER_RE = re.compile(r"Credit Card No\..*?XXXXXX(\d{4})")
-
-# --- NEW: Regex for Total Credit Limit (Two Patterns) ---
-
-# Pattern A (for "nadeem pdf.pdf" layout):
-# Finds the header line, then captures the *first* "C" amount on the next line.
-TOTAL_LIMIT_RE_A = re.compile(
+# This finds "Credit Card No.", allows the number to start on the next line,
+# matches any characters (non-greedy), then "XXXXXX", and captures the 4 digits.
+CARD_NUMBER_RE = re.compile(r"Credit Card No\.\s*.*?XXXXXX(\d{4})")
+
+# --- NEW: Regex for Total Credit Limit (Two Layouts, One Pass) ---
+# Both layouts share the header line, so they're fused into one alternation.
+# Group 1 is set for layout A, group 2 for layout B.
+TOTAL_LIMIT_RE = re.compile(
     r"TOTAL CREDIT LIMIT\n"  # Line 1: "TOTAL CREDIT LIMIT"
+    r"(?:"
+    # Layout A (for "nadeem pdf.pdf"): captures the *first* "C" amount on the next line.
     r"\s*\(Including Cash\).*AVAILABLE CREDIT LIMIT.*\n"  # Line 2: "(Including Cash) AVAILABLE..."
-    r"\s*C?([\d,]+\.?\d*)",  # Line 3: Capture the first amount
-    re.MULTILINE
-)
-
-# Pattern B (for "pds duplicate arbaaz.pdf" layout):
-# Finds the header line, skips 1-2 lines, then captures the amount.
-TOTAL_LIMIT_RE_B = re.compile(
-    r"TOTAL CREDIT LIMIT\n"  # Line 1: "TOTAL CREDIT LIMIT"
+    r"\s*C?([\d,]+\.?\d*)"  # Line 3: Capture the first amount
+    r"|"
+    # Layout B (for "pds duplicate arbaaz.pdf"): skips 1-2 lines, then captures the amount.
     r"(?:.*\n){1,2}"  # Line 2/3: Skip "AVAILABLE CREDIT..." & "(Including Cash)"
-    r"\s*([\d,]+\.?\d*)",  # Line 4: Capture the amount
+    r"\s*([\d,]+\.?\d*)"  # Line 4: Capture the amount
+    r")",
     re.MULTILINE
 )
 
 # Matches transaction dates like "08/10/2025" (at the start of a string)
 TX_DATE_RE = re.compile(r"^\d{2}/\d{2}/\d{4}")
 
+# Same date shape, but anywhere in a page's text. Used as a cheap check
+# before running table extraction on a page.
+TX_DATE_ANY_RE = re.compile(r"\d{2}/\d{2}/\d{4}")
+
+# Bank-related words stripped from the card name (whole words only,
+# e.g. "Card" but not "Carding").
+_CARD_NAME_CLEAN_RE = re.compile(r"\b(HDFC|Bank|Credit|Card|Statement)\b", re.IGNORECASE)
+
+# Runs of whitespace, collapsed to a single space.
+_WS_RE = re.compile(r"\s+")
+
+# Anything that isn't a digit or a dot, stripped from amounts ("₹", "C", "Cr").
+_AMOUNT_STRIP_RE = re.compile(r"[^0-9.]")
+
+# "Junk" middle columns in a transaction row. Both are matched against the
+# upper-cased column: EMI markers ("EMI"/"EM") by exact lookup, then reward
+# points deltas ("+57"), points balances ("1,234 pts") and foreign-currency
+# amounts ("USD 25.00") in a single regex pass.
+_JUNK_EXACT = frozenset({"EMI", "EM"})
+_JUNK_COL_RE = re.compile(r"^(?:[+-]\d+|\d+\s+PTS|(?:USD|EUR|GBP)\s+[\d.]+)$")
+
 
 # --- Helper Functions ---
 
@@ -72,18 +99,14 @@ def _clean_card_name(full_name: str) -> str:
     Removes the common bank-related words from the
     card name as per the user's request.
     """
-    words_to_remove = ["HDFC", "Bank", "Credit", "Card", "Statement"]
-    # Create a regex pattern to find any of these words, case-insensitive
-    # \b ensures we match whole words only (e.g., "Card" but not "Carding")
-    pattern = re.compile(r'\b(' + '|'.join(words_to_remove) + r')\b', re.IGNORECASE)
-    cleaned_name = pattern.sub('', full_name)
+    cleaned_name = _CARD_NAME_CLEAN_RE.sub('', full_name)
     # Clean up extra whitespace
-    return ' '.join(cleaned_name.split())
+    return _WS_RE.sub(' ', cleaned_name).strip()
 
 
-def _clean_amount(text: str) -> Optional[Decimal]:
+def _clean_amount(text: str) -> Optional[float]:
     """
-    Converts a string amount like '1,234.56', 'C3,00,000', '1,234.56 Cr', or '+86,962.00' into a Decimal.
+    Converts a string amount like '1,234.56', 'C3,00,000', '1,234.56 Cr', or '+86,962.00' into a float.
     - 'Cr' (Credit) or '+' prefix is treated as a negative number (e.g., a payment).
     - No suffix or 'Dr' is treated as positive (e.g., a purchase).
     - Strips "C", "₹", and ",".
@@ -99,17 +122,17 @@ def _clean_amount(text: str) -> Optional[Decimal]:
 
     # Remove all non-numeric/non-dot characters (including '₹' or 'C')
     # This is the key part that handles "C3,00,000"
-    cleaned_text = re.sub(r"[^0-9.]", "", text)
+    cleaned_text = _AMOUNT_STRIP_RE.sub("", text)
 
     try:
         if not cleaned_text:
             return None
-        amount = Decimal(cleaned_text)
+        amount = float(cleaned_text)
         if is_credit:
             return -amount  # Credits/payments are negative
         return amount  # Debits/purchases are positive
-    except (InvalidOperation, ValueError):
-        log.warning(f"Could not parse amount: {text}")
+    except ValueError:
+        log.warning("Could not parse amount: %s", text)
         return None
 
 
@@ -138,7 +161,7 @@ def _parse_transaction_row(row: List[str]) -> Optional[Transaction]:
     # The date is always the first element. It might have a time " | 11:58"
     date_str = row[0].split('|')[0].strip()
     if not TX_DATE_RE.match(date_str):
-        log.debug(f"Skipping row, invalid date format: {date_str}")
+        log.debug("Skipping row, invalid date format: %s", date_str)
         return None  # Not a valid transaction row
 
     # --- 2. Extract Amount ---
@@ -146,7 +169,7 @@ def _parse_transaction_row(row: List[str]) -> Optional[Transaction]:
     amount_str = row[-1]
     amount = _clean_amount(amount_str)
     if amount is None:
-        log.debug(f"Skipping row, invalid amount: {amount_str}")
+        log.debug("Skipping row, invalid amount: %s", amount_str)
         return None  # Not a valid transaction row
 
     # --- 3. Extract Merchant ---
@@ -160,14 +183,11 @@ def _parse_transaction_row(row: List[str]) -> Optional[Transaction]:
             continue
 
         part_stripped = part.strip()
+        part_upper = part_stripped.upper()
 
         # This filter removes common "junk" columns.
         # e.g., "EMI", "+57", "1,234 pts", "USD 25.00"
-        if part_stripped.upper() == "EMI" or \
-                part_stripped.upper() == "EM" or \
-                re.match(r"^[+-]\d+$", part_stripped) or \
-                re.match(r"^\d+\s+pts$", part_stripped, re.IGNORECASE) or \
-                re.match(r"^(USD|EUR|GBP)\s+[\d\.]+$", part_stripped, re.IGNORECASE):
+        if part_upper in _JUNK_EXACT or _JUNK_COL_RE.match(part_upper):
             continue
 
         merchant_parts.append(part_stripped)
@@ -175,37 +195,185 @@ def _parse_transaction_row(row: List[str]) -> Optional[Transaction]:
     merchant = " ".join(merchant_parts).strip()
 
     # Skip footer/summary rows
-    if not merchant or merchant.lower().startswith("total"):
+    if not merchant or merchant[:5].lower() == "total":
         return None
 
-    return Transaction(
+    # Inputs are already validated above, so skip Pydantic validation
+    # (model_construct) in this per-row hot path.
+    return Transaction.model_construct(
         date=date_str,
         merchant=merchant,
-        amount=float(amount)  # Convert Decimal to float for JSON
+        amount=amount
+    )
+
+
+# --- Page Extraction ---
+
+# Set ZUNO_PARALLEL_PAGES=1 to extract pages in a process pool. Off by default:
+# every worker re-opens the PDF, which only pays off on longer statements.
+PARALLEL_PAGES = os.getenv("ZUNO_PARALLEL_PAGES") == "1"
+PARALLEL_MIN_PAGES = 4
+
+# (page_text, has_transaction_table, transaction rows without the header)
+PageResult = Tuple[str, bool, List[List[str]]]
+
+_page_pool: Optional[ProcessPoolExecutor] = None
+_page_pool_lock = threading.Lock()
+
+
+def _init_page_worker(level: int) -> None:
+    """Process-pool initializer: spawned workers start with no logging configured."""
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    """
+    Lazily creates the process pool used for parallel page extraction.
+
+    parse_statement may be called from several threads, so creation is locked.
+    Workers are spawned rather than forked: a fork from the multithreaded
+    server could inherit locks (logging, MuPDF) held by other threads.
+    Workers log at the parent's level so per-page logs aren't lost.
+    """
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_page_worker,
+                initargs=(logging.getLogger().getEffectiveLevel(),),
+            )
+        return _page_pool
+
+
+def _page_text(page: pymupdf.Page) -> str:
+    """
+    Rebuilds the page text one visual line at a time from its words.
+
+    get_text("text") puts every text span on its own line, which splits
+    side-by-side labels ("(Including Cash)", "AVAILABLE CREDIT LIMIT") that
+    the summary regex expects on a single line. Words whose bottom edges
+    are within half a word height of each other are joined with spaces.
+    """
+    lines: List[list] = []
+    for word in sorted(page.get_text("words"), key=lambda w: w[3]):
+        x0, y0, x1, y1 = word[:4]
+        if lines and y1 - lines[-1][0][3] <= (y1 - y0) / 2:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return "\n".join(
+        " ".join(w[4] for w in sorted(line, key=lambda w: w[0]))
+        for line in lines
     )
 
 
+def _extract_page(page: pymupdf.Page, i: int) -> PageResult:
+    """
+    Extracts the text of a single page and the rows of any
+    transaction tables found on it.
+    """
+    # 2. Extract plain text (line-wise, which is what our regex expects)
+    # Only page one goes through the summary regex, so only it needs the
+    # line-rebuilt text; later pages just feed the cheap checks below.
+    page_text = _page_text(page) if i == 0 else page.get_text()
+
+    # Image-only pages (e.g. scanned marketing inserts) have no text
+    # layer; skip them before table extraction decodes their images.
+    if not page_text.strip():
+        log.info("Page %s: No text layer, skipping.", i + 1)
+        return page_text, False, []
+
+    # 3. Extract tables from the page
+    # Cheap check first: a page without a transaction date or the word
+    # "Transaction" (cover, T&C, marketing) can't hold the table.
+    if not TX_DATE_ANY_RE.search(page_text) and "Transaction" not in page_text:
+        log.info("Page %s: No transaction markers, skipping table extraction.", i + 1)
+        return page_text, False, []
+
+    tables = page.find_tables(
+        vertical_strategy="text",
+        horizontal_strategy="text",
+    ).tables
+    log.info("Page %s: Found %s tables.", i + 1, len(tables))
+
+    has_transaction_table = False
+    rows: List[List[str]] = []
+    for table in tables:
+        # PyMuPDF returns None for empty cells; normalise to ""
+        table_rows = [[cell or "" for cell in row] for row in table.extract()]
+        if not table_rows:
+            continue
+
+        header = table_rows[0]
+        if _is_transaction_table(header):
+            log.info("Found transaction table on page %s", i + 1)
+            has_transaction_table = True
+            # Keep the rows, skipping the header
+            rows.extend(table_rows[1:])
+
+    return page_text, has_transaction_table, rows
+
+
+def _extract_page_range(file_bytes: bytes, password: str, start: int, stop: int) -> List[PageResult]:
+    """Process-pool worker: opens the PDF and extracts pages [start, stop)."""
+    pdf = pymupdf.open(stream=file_bytes, filetype="pdf")
+    try:
+        if pdf.needs_pass:
+            pdf.authenticate(password)
+        return [_extract_page(pdf.load_page(i), i) for i in range(start, stop)]
+    finally:
+        pdf.close()
+
+
+def _extract_pages_parallel(file_bytes: bytes, password: str, num_pages: int) -> List[PageResult]:
+    """Splits the pages into one contiguous chunk per worker and extracts them in parallel."""
+    workers = min(num_pages, os.cpu_count() or 1)
+    chunk_size = math.ceil(num_pages / workers)
+    pool = _get_page_pool()
+    futures = [
+        pool.submit(_extract_page_range, file_bytes, password, start, min(start + chunk_size, num_pages))
+        for start in range(0, num_pages, chunk_size)
+    ]
+    # Collect in submission order so pages stay in document order
+    return [result for future in futures for result in future.result()]
+
+
 # --- Main Parsing Function ---
 
-def parse_statement(file_bytes: io.BytesIO, password: str) -> StatementDetails:
+def parse_statement(file_bytes: bytes, password: str, max_pages: Optional[int] = 5) -> StatementDetails:
     """
     Main parsing function. Opens the PDF, extracts text and tables,
     and populates a StatementDetails object.
+
+    If no transaction table turns up in the first `max_pages` pages (None
+    means no limit), the remaining pages are skipped, so pathological or
+    scanned PDFs can't tie up a worker indefinitely. Once the table has been
+    found it is always read to the end, however many pages it spans.
     """
     pdf = None
     try:
         # 1. Open the PDF
-        pdf = pdfplumber.open(file_bytes, password=password)
-    except pdfplumber.errors.PasswordError:
-        log.warning("PDF password error.")
-        raise PasswordError("Invalid password")
+        pdf = pymupdf.open(stream=file_bytes, filetype="pdf")
     except Exception as e:
-        log.error(f"Failed to open PDF. It may be corrupted. Error: {e}")
+        log.error("Failed to open PDF. It may be corrupted. Error: %s", e)
         raise ParsingError(f"Failed to open PDF: {e}")
 
-    if not pdf:
+    if pdf is None:
         raise ParsingError("PDF object is null, cannot proceed.")
 
+    # authenticate() returns 0 when the password is wrong
+    if pdf.needs_pass and not pdf.authenticate(password):
+        pdf.close()
+        log.warning("PDF password error.")
+        raise PasswordError("Invalid password")
+
+    # Encrypted PDFs can report 0 pages until they are authenticated, so the
+    # page count is only meaningful from here on.
+    if pdf.page_count == 0:
+        pdf.close()
+        raise ParsingError("PDF has no pages, cannot proceed.")
+
     # --- Data Extraction ---
     transactions: List[Transaction] = []
     card_name: Optional[str] = None
@@ -219,39 +387,49 @@ def parse_statement(file_bytes: io.BytesIO, password: str) -> StatementDetails:
     page_one_text = ""
 
     try:
-        log.info(f"PDF opened successfully. {len(pdf.pages)} pages found.")
+        num_pages = pdf.page_count
+        log.info("PDF opened successfully. %s pages found.", num_pages)
 
         # --- Page Loop (for tables) ---
-        for i, page in enumerate(pdf.pages):
-            # 2. Extract text with layout preservation
-            # This is crucial for our regex to understand lines and blocks
-            page_text = page.extract_text(x_tolerance=2, layout=True)
-            if not page_text:
-                continue
+        # Sequential extraction is lazy, so breaking out of the loop below
+        # skips the remaining pages entirely. Each page is loaded on demand
+        # and only referenced while it's being extracted, so PyMuPDF frees
+        # it before the next one is loaded and memory stays flat. The parallel
+        # path extracts every page up front and applies the same stop rules.
+        page_results: Iterable[PageResult]
+        if PARALLEL_PAGES and num_pages >= PARALLEL_MIN_PAGES:
+            log.info("Extracting %s pages in parallel.", num_pages)
+            page_results = _extract_pages_parallel(file_bytes, password, num_pages)
+        else:
+            page_results = (_extract_page(pdf.load_page(i), i) for i in range(num_pages))
+
+        transactions_table_found = False
+        for i, (page_text, page_has_transactions, rows) in enumerate(page_results):
+            # Only pages *before* the transaction table count towards max_pages
+            if not transactions_table_found and max_pages is not None and i >= max_pages:
+                log.warning("No transaction table in the first %s pages, skipping remaining pages.", max_pages)
+                break
 
             if i == 0:
                 # Store page one text for summary regex
                 page_one_text = page_text
 
-            # 3. Extract tables from the page
-            tables = page.extract_tables(table_settings={
-                "vertical_strategy": "text",
-                "horizontal_strategy": "text",
-            })
-            log.info(f"Page {i + 1}: Found {len(tables)} tables.")
-
-            for table in tables:
-                if not table:
-                    continue
-
-                header = table[0]
-                if _is_transaction_table(header):
-                    log.info(f"Found transaction table on page {i + 1}")
-                    # Iterate rows, skipping the header
-                    for row in table[1:]:
-                        tx = _parse_transaction_row(row)
-                        if tx:
-                            transactions.append(tx)
+            # Pages without a text layer don't end the transaction table run
+            if not page_text.strip():
+                continue
+
+            for row in rows:
+                tx = _parse_transaction_row(row)
+                if tx:
+                    transactions.append(tx)
+
+            # Transactions sit in one contiguous run of pages. Once that run
+            # has ended, the remaining pages are T&C/marketing, so stop here.
+            if page_has_transactions:
+                transactions_table_found = True
+            elif transactions_table_found:
+                log.info("Transaction table ended before page %s, skipping remaining pages.", i + 1)
+                break
 
         # 4. Post-process the full text *of page one* with regex
         # This is more stable for finding summary details.
@@ -260,37 +438,38 @@ def parse_statement(file_bytes: io.BytesIO, password: str) -> StatementDetails:
         if (match := CARD_NAME_RE.search(page_one_text)):
             full_card_name = match.group(1).strip()
             card_name = _clean_card_name(full_card_name)
-            log.info(f"Found Card Name: {card_name} (from '{full_card_name}')")
+            log.info("Found Card Name: %s (from '%s')", card_name, full_card_name)
 
         # Find Name on Card (Rule 3)
         if (match := NAME_ON_CARD_RE.search(page_one_text)):
             # Group 1 is the name
             name_on_card = match.group(1).strip()
-            log.info(f"Found Name on Card: {name_on_card}")
+            log.info("Found Name on Card: %s", name_on_card)
 
         # Find Last 4 Digits (Rule 2)
         if (match := CARD_NUMBER_RE.search(page_one_text)):
             # Group 1 is the 4 digits
             card_last_4_digits = match.group(1)
-            log.info(f"Found Last 4 Digits: {card_last_4_digits}")
+            log.info("Found Last 4 Digits: %s", card_last_4_digits)
 
         # Find Total Credit Limit (User Request)
-        # --- NEW LOGIC: Try Pattern A, then Pattern B ---
+        # --- NEW LOGIC: One pass, layout A is tried before layout B ---
         limit_str = None
-        if (match := TOTAL_LIMIT_RE_A.search(page_one_text)):
-            limit_str = match.group(1)
-            log.info("Matched Total Limit with Pattern A (Nadeem-style PDF)")
-        elif (match := TOTAL_LIMIT_RE_B.search(page_one_text)):
-            limit_str = match.group(1)
-            log.info("Matched Total Limit with Pattern B (Arbaaz-style PDF)")
+        if (match := TOTAL_LIMIT_RE.search(page_one_text)):
+            if match.group(1):
+                limit_str = match.group(1)
+                log.info("Matched Total Limit with Pattern A (Nadeem-style PDF)")
+            else:
+                limit_str = match.group(2)
+                log.info("Matched Total Limit with Pattern B (Arbaaz-style PDF)")
 
         if limit_str:
-            limit_decimal = _clean_amount(limit_str)  # Use clean_amount to handle "C" and ","
-            if limit_decimal is not None:
-                total_limit = float(abs(limit_decimal))  # Use abs() just in case
-                log.info(f"Found Total Credit Limit: {total_limit}")
+            limit_amount = _clean_amount(limit_str)  # Use clean_amount to handle "C" and ","
+            if limit_amount is not None:
+                total_limit = abs(limit_amount)  # Use abs() just in case
+                log.info("Found Total Credit Limit: %s", total_limit)
         else:
-            log.warning("Could not find Total Credit Limit. Both regex patterns failed.")
+            log.warning("Could not find Total Credit Limit. Neither layout matched.")
 
         if not transactions:
             log.warning("No transactions were found for file.")
@@ -308,7 +487,7 @@ def parse_statement(file_bytes: io.BytesIO, password: str) -> StatementDetails:
         )
 
     except Exception as e:
-        log.error(f"Error during PDF parsing logic: {e}", exc_info=True)
+        log.error("Error during PDF parsing logic: %s", e, exc_info=True)
         raise ParsingError(f"Error during PDF parsing: {e}")
     finally:
         if pdf:
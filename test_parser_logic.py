@@ -0,0 +1,134 @@
+import pymupdf
+
+from parser_logic import (
+    CARD_NAME_RE,
+    CARD_NUMBER_RE,
+    NAME_ON_CARD_RE,
+    TOTAL_LIMIT_RE,
+    _clean_card_name,
+    _page_text,
+    parse_statement,
+)
+
+# Page-one text as produced by _page_text: one visual line per row,
+# side-by-side words joined with single spaces.
+
+# "nadeem pdf.pdf" layout: the limits sit in columns under one header row.
+PAGE_ONE_LAYOUT_A = (
+    "HDFC Bank Business Regalia First Credit Card Statement\n"
+    "Statement Date 01/10/2025\n"
+    "ARBAAZ KHAN Credit Card No. 489377XXXXXX1234\n"
+    "TOTAL CREDIT LIMIT\n"
+    "(Including Cash) AVAILABLE CREDIT LIMIT AVAILABLE CASH LIMIT\n"
+    "C3,00,000 C2,50,000 C1,20,000\n"
+)
+
+# "pds duplicate arbaaz.pdf" layout: the labels are stacked above the amount,
+# and the name and card number are on separate lines.
+PAGE_ONE_LAYOUT_B = (
+    "Tata Neu Infinity HDFC Bank Credit Card Statement\n"
+    "NADEEM HASSAN\n"
+    "Credit Card No.\n"
+    "6522 12XXXXXX9876\n"
+    "TOTAL CREDIT LIMIT\n"
+    "AVAILABLE CREDIT LIMIT\n"
+    "(Including Cash)\n"
+    "1,50,000\n"
+)
+
+
+# --- Summary regexes ---
+
+def test_card_name_layout_a():
+    match = CARD_NAME_RE.search(PAGE_ONE_LAYOUT_A)
+    assert match.group(1) == "HDFC Bank Business Regalia First Credit Card"
+    assert _clean_card_name(match.group(1)) == "Business Regalia First"
+
+
+def test_card_name_layout_b():
+    match = CARD_NAME_RE.search(PAGE_ONE_LAYOUT_B)
+    assert _clean_card_name(match.group(1)) == "Tata Neu Infinity"
+
+
+def test_name_on_card_same_line():
+    match = NAME_ON_CARD_RE.search(PAGE_ONE_LAYOUT_A)
+    assert match.group(1) == "ARBAAZ KHAN"
+
+
+def test_name_on_card_previous_line():
+    match = NAME_ON_CARD_RE.search(PAGE_ONE_LAYOUT_B)
+    assert match.group(1) == "NADEEM HASSAN"
+
+
+def test_name_on_card_requires_ten_characters():
+    assert NAME_ON_CARD_RE.search("AB KHAN Credit Card No. 489377XXXXXX1234") is None
+
+
+def test_card_number_same_line():
+    assert CARD_NUMBER_RE.search(PAGE_ONE_LAYOUT_A).group(1) == "1234"
+
+
+def test_card_number_next_line():
+    assert CARD_NUMBER_RE.search(PAGE_ONE_LAYOUT_B).group(1) == "9876"
+
+
+def test_total_limit_layout_a():
+    match = TOTAL_LIMIT_RE.search(PAGE_ONE_LAYOUT_A)
+    assert match.group(1) == "3,00,000"
+    assert match.group(2) is None
+
+
+def test_total_limit_layout_b():
+    match = TOTAL_LIMIT_RE.search(PAGE_ONE_LAYOUT_B)
+    assert match.group(1) is None
+    assert match.group(2) == "1,50,000"
+
+
+def test_total_limit_layout_b_single_label_line():
+    text = "TOTAL CREDIT LIMIT\nAVAILABLE CREDIT LIMIT\n2,00,000\n"
+    assert TOTAL_LIMIT_RE.search(text).group(2) == "2,00,000"
+
+
+def test_total_limit_missing():
+    assert TOTAL_LIMIT_RE.search("TOTAL CREDIT LIMIT\nNot available\nSee overleaf\n") is None
+
+
+# --- Page text ---
+
+def test_page_text_joins_side_by_side_words_into_one_line():
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        page.insert_text((50, 90), "TOTAL CREDIT LIMIT", fontsize=9)
+        page.insert_text((50, 100), "(Including Cash)", fontsize=9)
+        page.insert_text((200, 100), "AVAILABLE CREDIT LIMIT", fontsize=9)
+        page.insert_text((200, 110), "C2,50,000", fontsize=9)
+        page.insert_text((50, 110), "C3,00,000", fontsize=9)
+
+        assert _page_text(page) == (
+            "TOTAL CREDIT LIMIT\n"
+            "(Including Cash) AVAILABLE CREDIT LIMIT\n"
+            "C3,00,000 C2,50,000"
+        )
+
+
+# --- Page loop ---
+
+def _statement_pdf(tx_pages: int, rows_per_page: int) -> bytes:
+    """Builds a statement: a summary page, `tx_pages` transaction pages and a T&C page."""
+    with pymupdf.open() as doc:
+        doc.new_page().insert_text((50, 50), "HDFC Bank Millennia Credit Card Statement", fontsize=9)
+        for n in range(tx_pages):
+            page = doc.new_page()
+            rows = [("Date", "Transaction Description", "Amount (in Rs.)")]
+            rows += [(f"{r + 1:02d}/10/2025", f"MERCHANT {n} {r}", f"{100 + r}.00") for r in range(rows_per_page)]
+            for k, row in enumerate(rows):
+                for x, text in zip((50, 160, 400), row):
+                    page.insert_text((x, 120 + k * 14), text, fontsize=9)
+        doc.new_page().insert_text((50, 50), "Terms and conditions apply.", fontsize=9)
+        return doc.tobytes()
+
+
+def test_transaction_table_is_read_past_max_pages():
+    details = parse_statement(_statement_pdf(tx_pages=6, rows_per_page=10), "", max_pages=5)
+    assert len(details.transactions) == 60
+    assert details.transactions[-1].merchant == "MERCHANT 5 9"